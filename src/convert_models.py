@@ -0,0 +1,33 @@
+"""This module converts the ngram language models stored in JSON\
+    files into directories of NumPy arrays, which the bot loads\
+    without parsing them."""
+
+# imports standard python libraries
+from pathlib import Path
+from argparse import ArgumentParser
+
+# local modules
+from ngram_lm import NGramLanguageModel
+
+def main(args) -> None:
+    """This function will convert all the JSON models of a folder."""
+    out_directory = args.out_directory or args.models_folder
+    for model_file in sorted(Path(args.models_folder).glob("*.json")):
+        ngram_lm = NGramLanguageModel()
+        ngram_lm.load_model(model_file)
+        ngram_lm.save_model_npy(out_directory, model_file.stem)
+
+if __name__ == "__main__" :
+    parser = ArgumentParser()
+    parser.add_argument("--models_folder",
+                        type=str,
+                        default="ngram_language_models",
+                        help="The folder containing the JSON models.",
+                        required=False)
+    parser.add_argument("--out_directory",
+                        type=str,
+                        default=None,
+                        help="The directory where the converted models will be\
+                            stored. Default to the folder of the JSON models.",
+                        required=False)
+    main(parser.parse_args())
@@ -1,26 +1,112 @@
 """This module implements a ngram language model."""
 
 # imports standard python libraries
-import random
-from random import shuffle
-from typing import Union, Tuple, Iterator
+import math
+from typing import Union, Tuple, Iterator, Dict, List, Sequence, Set
 import json
 import logging
 from pathlib import Path
-from itertools import tee
-from collections import defaultdict
+from itertools import islice
 from argparse import ArgumentParser
 
 # import installed packages
 import numpy as np
 
 
-random.seed(1798)
+# number of train utterances whose ngrams are counted at once
+CHUNK_SIZE = 100_000
+# largest level of the quantized log probabilities of the stacked models
+QUANTIZATION_LEVELS = np.iinfo(np.uint16).max
 
 LOGGER = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
-Ngram = Tuple[str]
+# the tokens are characters, so a ngram is a string of length ngram_size
+Ngram = str
+NgramCounter = Dict[Ngram, Dict[str, int]]
+
+def encode_utterance(utterance: str) -> np.ndarray:
+    """
+    Return the code points of the characters of an utterance.\
+    This encoding does not depend on the language model, so it can be\
+    computed once and then scored by the models of several languages.
+
+    Parameters
+    ----------
+    - utterance: str
+        The utterance to encode.
+
+    Return
+    ------
+    - array of int:
+        The code points of the characters of the utterance.
+    """
+    # the lone surrogates, which may come from the JSON of the tweets,\
+    # are kept as characters of their own
+    return np.frombuffer(utterance.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+def _pad_code_points(code_points: np.ndarray, padding: int) -> np.ndarray:
+    """Add `padding` start tokens '<' and end tokens '>' to an encoded utterance."""
+    return np.concatenate((np.full(padding, ord("<"), dtype=np.uint32),
+                            code_points,
+                            np.full(padding, ord(">"), dtype=np.uint32)))
+
+def _lookup_token_ids(vocabulary_code_points: np.ndarray,
+                        code_points: np.ndarray) -> np.ndarray:
+    """
+    Map code points to their ranks in the sorted code points of a\
+    vocabulary, the characters out of the vocabulary getting the id\
+    `len(vocabulary_code_points)`.
+
+    Parameters
+    ----------
+    - vocabulary_code_points: array of int
+        The sorted code points of the vocabulary.
+    - code_points: array of int
+        The code points of the characters to map.
+
+    Return
+    ------
+    - array of int:
+        The token ids of the characters.
+    """
+    token_ids = np.searchsorted(vocabulary_code_points, code_points)
+    positions = np.minimum(token_ids, len(vocabulary_code_points) - 1)
+    token_ids[vocabulary_code_points[positions] != code_points] = len(vocabulary_code_points)
+    return token_ids.astype(np.int64, copy=False)
+
+def _pack_token_ids(token_ids: np.ndarray,
+                    base: int,
+                    ngram_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack the ngrams of a sequence of token ids and their left\
+    contexts into integers written in a given base.
+
+    Parameters
+    ----------
+    - token_ids: array of int
+        The ids of the tokens from which to extract the ngrams.
+    - base: int
+        The base in which the ngrams are packed.
+    - ngram_size: int
+        The size of the ngrams.
+
+    Return
+    ------
+    - Tuple of arrays:
+        The packed left contexts and the packed ngrams.
+    """
+    number_of_ngrams = max(len(token_ids) - ngram_size + 1, 0)
+    # Horner's scheme computed in place, so that no temporary array\
+    # is allocated per token of the ngrams.
+    context_keys = np.zeros(number_of_ngrams, dtype=np.int64)
+    for shift in range(ngram_size - 1):
+        context_keys *= base
+        context_keys += token_ids[shift:shift + number_of_ngrams]
+    ngram_keys = context_keys * base
+    ngram_keys += token_ids[ngram_size - 1:]
+    return context_keys, ngram_keys
+
 class NGramLanguageModel:
     """
     This class implements a ngram language model with
@@ -46,8 +132,32 @@ class NGramLanguageModel:
         self.pad_utterances = pad_utterances
         self.ngram_size = ngram_size
         self.smooth = smooth
-        self.ngram_counter = defaultdict(lambda: defaultdict(int))
         self.denominator_smoother = None
+        # token -> integer id. The ngrams are packed in a single integer\
+        # by writing their token ids in base `len(vocabulary) + 1`.
+        self.vocabulary: Dict[str, int] = {}
+        # the tokens being characters sorted by code point, the id\
+        # of a token is the rank of its code point in this array.
+        self.code_points = np.empty(0, dtype=np.uint32)
+        # counts of the ngrams in compressed sparse rows: the next tokens\
+        # seen after the i-th sorted packed left context have their sorted\
+        # ids and their counts between row_ptr[i] and row_ptr[i + 1].
+        self.context_keys = np.empty(0, dtype=np.int64)
+        self.row_ptr = np.zeros(1, dtype=np.int64)
+        self.next_token_ids = np.empty(0, dtype=np.int32)
+        self.ngram_counts = np.empty(0, dtype=np.int64)
+        # sorted packed ngrams, each left context being closed by\
+        # the ngram of its out of vocabulary next token, with their log\
+        # probabilities, their left contexts and the log probability\
+        # of an unseen next token after their left contexts. The log\
+        # probabilities are stored in single precision, which is plenty\
+        # to compare utterances and halves the memory they use.
+        self.lookup_keys = np.empty(0, dtype=np.int64)
+        self.lookup_logprobs = np.empty(0, dtype=np.float32)
+        self.lookup_context_keys = np.empty(0, dtype=np.int64)
+        self.lookup_unseen_logprobs = np.empty(0, dtype=np.float32)
+        self.log_smooth = None
+        self.log_unk = None
 
     def get_ngrams(self, utterance: str) -> Iterator[Ngram] :
         """
@@ -55,26 +165,29 @@ class NGramLanguageModel:
 
         Parameters
         ----------
-        - splitted_utterance: list of strings
+        - utterance: str
             The utterance from which to extract the ngrams.
 
         Return
         -------
-        - list:
-            List of ngrams extracted from the utterance.
+        - iterator:
+            The ngrams extracted from the utterance, as substrings\
+            of length ngram_size.
         """
+        utterance = self._pad(utterance)
+        # This returned iterable will be empty if the length of the utterance
+        # is smaller than the ngram size.
+        return (utterance[index:index + self.ngram_size]
+                for index in range(len(utterance) - self.ngram_size + 1))
+
+    def _pad(self, utterance: str) -> str:
+        """Pad the utterance if the model pads the utterances."""
         if self.pad_utterances :
             # add '<' for start token padding and '>' for\
             # end token padding
-            utterance = (["<"] * (self.ngram_size - 1)) \
-                + list(utterance) + ([">"] * (self.ngram_size - 1))
-        iterables = tee(utterance, self.ngram_size)
-        for number_of_shifts, iterator in enumerate(iterables) :
-            for _ in range(number_of_shifts) :
-                next(iterator, None)
-        # This returned iterable will be empty if the length of the utterance
-        # is smaller than the ngram size.
-        return zip(*iterables)
+            utterance = ("<" * (self.ngram_size - 1)) \
+                + utterance + (">" * (self.ngram_size - 1))
+        return utterance
 
     def estimate(self, train_file: str) -> None:
         """
@@ -87,20 +200,61 @@ class NGramLanguageModel:
             with one sentence per line.
         """
         LOGGER.info("Training the model...")
+        # first pass to build the vocabulary, so that the ngrams of\
+        # the second pass can be packed as soon as they are read.
+        tokens = set(self._pad(""))
         with open(train_file, mode="r", encoding="utf-8") as sentences_file:
-            vocabulary = set()
             for utterance in sentences_file :
-                utterance = utterance.strip()
-                for ngram in self.get_ngrams(utterance):
-                    *context_tokens, next_token = ngram
-                    self.ngram_counter[tuple(context_tokens)][next_token] += 1
-                    vocabulary.add(next_token)
-
-            # will be used to smooth the probability distribution
-            # by adding the 'smooth' value to each token
-            # in the vocabulary
-            self.denominator_smoother = len(vocabulary) * self.smooth
+                tokens.update(utterance.strip())
+        self._set_vocabulary(tokens)
+        chunks_keys, chunks_counts = [], []
+        with open(train_file, mode="r", encoding="utf-8") as sentences_file:
+            for utterances in iter(lambda: list(islice(sentences_file,
+                                                        CHUNK_SIZE)), []):
+                ngram_keys = self._pack_corpus(utterances)
+                ngram_keys, ngram_counts = np.unique(ngram_keys,
+                                                        return_counts=True)
+                chunks_keys.append(ngram_keys)
+                chunks_counts.append(ngram_counts)
+        # sum the counts of the ngrams seen in several chunks
+        ngram_keys = np.concatenate(chunks_keys)
+        order = np.argsort(ngram_keys, kind="stable")
+        ngram_keys, starts = np.unique(ngram_keys[order], return_index=True)
+        ngram_counts = np.add.reduceat(np.concatenate(chunks_counts)[order],
+                                        starts)
+        # will be used to smooth the probability distribution
+        # by adding the 'smooth' value to each token
+        # in the vocabulary
+        next_tokens = np.unique(ngram_keys % self._base())
+        self.denominator_smoother = len(next_tokens) * self.smooth
+        self._set_counts(ngram_keys, ngram_counts)
         LOGGER.info("Model trained!")
+
+    def _pack_corpus(self, utterances: List[str]) -> np.ndarray:
+        """
+        Pack all the ngrams of a chunk of train utterances at once.
+
+        Parameters
+        ----------
+        - utterances: list of str
+            The raw train utterances.
+
+        Return
+        ------
+        - array of int:
+            The packed ngrams of the utterances, ngrams overlapping\
+            two utterances excluded.
+        """
+        utterances = [self._pad(utterance.strip()) for utterance in utterances]
+        corpus = "".join(utterances)
+        _, ngram_keys = self._pack_token_ids(
+                            self._token_ids(encode_utterance(corpus)))
+        # a ngram belongs to an utterance if its first and last tokens do.
+        utterance_ids = np.repeat(np.arange(len(utterances)),
+                                    [len(utterance) for utterance in utterances])
+        same_utterance = utterance_ids[:len(ngram_keys)] \
+                            == utterance_ids[self.ngram_size - 1:]
+        return ngram_keys[same_utterance]
         
     def save_model(self, out_dirname: str, out_filename: str) -> None:
         """
@@ -115,10 +269,8 @@ class NGramLanguageModel:
             The filename of the model.
         """
         LOGGER.info("Saving the model...")
-        model = [(" ".join(ngram), dict(next_token))
-                    for ngram, next_token in self.ngram_counter.items()]
-        shuffle(model)
-        model = dict(model)
+        model = {" ".join(left_context): next_tokens
+                    for left_context, next_tokens in self._ngram_counter().items()}
         model["language"] = self.language
         model["pad_utterances"] = self.pad_utterances
         model["denominator_smoother"] = self.denominator_smoother
@@ -153,10 +305,281 @@ class NGramLanguageModel:
             del model["denominator_smoother"]
             del model["smooth"]
             del model["ngram_size"]
-            self.ngram_counter = {tuple(ngram.split(" ")) : next_tokens \
-                                    for ngram, next_tokens in model.items()}
+            # the tokens are characters joined by spaces, so taking one\
+            # character out of two also recovers the space tokens.
+            ngram_counter = {ngram[::2] : next_tokens \
+                                for ngram, next_tokens in model.items()}
+        self._index_counts(ngram_counter)
         LOGGER.info("Modele loaded.")
 
+    def save_model_npy(self, out_dirname: str, out_filename: str) -> None:
+        """
+        Save the estimated parameters of the language model as\
+        NumPy arrays and its hyperparameters in a JSON file, all in\
+        a directory named after the model. Unlike the JSON format,\
+        this format is loaded without parsing nor building any dict.
+
+        Parameters
+        ----------
+        - out_dirname: str
+            The directory where the model will be stored.
+        - out_filename: str
+            The name of the directory of the model.
+        """
+        LOGGER.info("Saving the model...")
+        out_directory = Path(out_dirname) / out_filename
+        out_directory.mkdir(parents=True, exist_ok=True)
+        hyperparameters = {"language": self.language,
+                            "pad_utterances": self.pad_utterances,
+                            "denominator_smoother": self.denominator_smoother,
+                            "smooth": self.smooth,
+                            "ngram_size": self.ngram_size}
+        with open(out_directory / "hyperparameters.json",
+                    "w", encoding="utf-8") as hyperparameters_file:
+            json.dump(hyperparameters, hyperparameters_file)
+        np.save(out_directory / "code_points.npy", self.code_points)
+        np.save(out_directory / "context_keys.npy", self.context_keys)
+        np.save(out_directory / "row_ptr.npy", self.row_ptr)
+        np.save(out_directory / "next_token_ids.npy", self.next_token_ids)
+        np.save(out_directory / "ngram_counts.npy", self.ngram_counts)
+        LOGGER.info("Modle saved!")
+
+    def load_model_npy(self, path: str) -> None:
+        """
+        Load a language model stored with `save_model_npy`.\
+        The ngram arrays are read as they are, without any parsing.
+
+        Parameters
+        ----------
+        - path: str
+            Path to the directory where the language model is stored.
+        """
+        LOGGER.info("Loading the model...")
+        model_directory = Path(path)
+        with open(model_directory / "hyperparameters.json",
+                    mode="r", encoding="utf-8") as hyperparameters_file:
+            hyperparameters = json.load(hyperparameters_file)
+            self.language = hyperparameters["language"]
+            self.pad_utterances = hyperparameters["pad_utterances"]
+            self.denominator_smoother = hyperparameters["denominator_smoother"]
+            self.smooth = hyperparameters["smooth"]
+            self.ngram_size = hyperparameters["ngram_size"]
+        self.code_points = np.load(model_directory / "code_points.npy")
+        self.vocabulary = {chr(code_point): token_id
+                            for token_id, code_point in enumerate(self.code_points.tolist())}
+        self.context_keys = np.load(model_directory / "context_keys.npy")
+        self.row_ptr = np.load(model_directory / "row_ptr.npy")
+        self.next_token_ids = np.load(model_directory / "next_token_ids.npy")
+        self.ngram_counts = np.load(model_directory / "ngram_counts.npy")
+        self._build_log_tables()
+        LOGGER.info("Modele loaded.")
+
+    def _index_counts(self, ngram_counter: NgramCounter) -> None:
+        """
+        Store the counts of a nested ngram counter in contiguous\
+        arrays of packed ngrams sorted in ascending order, so that\
+        the counts of all the ngrams of an utterance can be looked up\
+        at once with a binary search.
+
+        Parameters
+        ----------
+        - ngram_counter: dict
+            Mapping from left contexts to the counts of their next tokens.
+        """
+        tokens = set()
+        for left_context, next_tokens in ngram_counter.items():
+            tokens.update(left_context)
+            tokens.update(next_tokens)
+        self._set_vocabulary(tokens)
+        base = self._base()
+        ngram_keys: List[int] = []
+        ngram_counts: List[int] = []
+        for left_context, next_tokens in ngram_counter.items():
+            context_key = 0
+            for token in left_context:
+                context_key = context_key * base + self.vocabulary[token]
+            for next_token, count in next_tokens.items():
+                ngram_keys.append(context_key * base + self.vocabulary[next_token])
+                ngram_counts.append(count)
+        ngram_keys = np.array(ngram_keys, dtype=np.int64)
+        order = np.argsort(ngram_keys)
+        self._set_counts(ngram_keys[order],
+                            np.array(ngram_counts, dtype=np.int64)[order])
+
+    def _set_counts(self, ngram_keys: np.ndarray, ngram_counts: np.ndarray) -> None:
+        """
+        Store the counts of sorted packed ngrams in compressed\
+        sparse rows indexed by their left contexts.
+
+        Parameters
+        ----------
+        - ngram_keys: array of int
+            The packed ngrams, sorted in ascending order.
+        - ngram_counts: array of int
+            The counts of the ngrams.
+        """
+        base = self._base()
+        # the ngrams are sorted by left context first, so the ngrams
+        # sharing the same left context are contiguous.
+        self.context_keys, starts = np.unique(ngram_keys // base,
+                                                return_index=True)
+        self.row_ptr = np.append(starts, len(ngram_keys))
+        self.next_token_ids = (ngram_keys % base).astype(np.int32)
+        self.ngram_counts = ngram_counts
+        self._build_log_tables()
+
+    def _ngram_counter(self) -> NgramCounter:
+        """Rebuild the nested ngram counter from the sparse rows."""
+        base = self._base()
+        tokens = sorted(self.vocabulary, key=self.vocabulary.get)
+        next_token_ids = self.next_token_ids.tolist()
+        ngram_counts = self.ngram_counts.tolist()
+        row_ptr = self.row_ptr.tolist()
+        ngram_counter = {}
+        for row, context_key in enumerate(self.context_keys.tolist()):
+            left_context = []
+            for _ in range(self.ngram_size - 1):
+                context_key, token_id = divmod(context_key, base)
+                left_context.append(tokens[token_id])
+            start, end = row_ptr[row], row_ptr[row + 1]
+            ngram_counter["".join(reversed(left_context))] = {
+                tokens[token_id]: count
+                for token_id, count in zip(next_token_ids[start:end],
+                                            ngram_counts[start:end])}
+        return ngram_counter
+
+    def _set_vocabulary(self, tokens: Set[str]) -> None:
+        """
+        Assign to each token the rank of its code point as id.
+
+        Parameters
+        ----------
+        - tokens: set of str
+            The characters of the vocabulary.
+        """
+        tokens = sorted(tokens)
+        self.vocabulary = {token: token_id for token_id, token in enumerate(tokens)}
+        self.code_points = np.array([ord(token) for token in tokens],
+                                    dtype=np.uint32)
+        if self._base() ** self.ngram_size >= 2 ** 63:
+            raise ValueError("The ngrams are too long to be packed in 64 bits.")
+
+    def _base(self) -> int:
+        """The base in which the ngrams are packed, one digit being\
+        left for the tokens out of the vocabulary."""
+        return len(self.vocabulary) + 1
+
+    def _token_ids(self, code_points: np.ndarray) -> np.ndarray:
+        """
+        Map code points to their token ids with a binary search over\
+        the code points of the vocabulary, the characters out of\
+        the vocabulary getting the id `len(vocabulary)`.
+
+        Parameters
+        ----------
+        - code_points: array of int
+            The code points of the characters to map.
+
+        Return
+        ------
+        - array of int:
+            The token ids of the characters.
+        """
+        return _lookup_token_ids(self.code_points, code_points)
+
+    def _pack_ngrams(self, tokens: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pack the ngrams of a given sequence of tokens and their left\
+        contexts into integers.
+
+        Parameters
+        ----------
+        - tokens: sequence of str
+            The already padded characters from which to extract the ngrams.
+
+        Return
+        ------
+        - Tuple of arrays:
+            The packed left contexts and the packed ngrams of the utterance.
+        """
+        return self._pack_token_ids(
+                    self._token_ids(encode_utterance("".join(tokens))))
+
+    def _pack_token_ids(self, token_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pack the ngrams of a sequence of token ids and their left\
+        contexts into integers.
+
+        Parameters
+        ----------
+        - token_ids: array of int
+            The ids of the tokens from which to extract the ngrams.
+
+        Return
+        ------
+        - Tuple of arrays:
+            The packed left contexts and the packed ngrams.
+        """
+        return _pack_token_ids(token_ids, self._base(), self.ngram_size)
+
+    def _build_log_tables(self) -> None:
+        """
+        Precompute the log probability of each seen ngram and of an\
+        unseen next token after each seen left context, so that scoring\
+        an ngram no longer needs to sum the counts nor to call the log\
+        function, and needs a single binary search.
+        """
+        self.log_smooth = math.log(self.smooth)
+        # log probability of a ngram with an unknown left context
+        self.log_unk = self.log_smooth - math.log(self.denominator_smoother)
+        base = self._base()
+        row_lengths = np.diff(self.row_ptr)
+        context_totals = np.add.reduceat(self.ngram_counts, self.row_ptr[:-1])
+        context_logden = np.log(context_totals + self.denominator_smoother)
+        unseen_logprobs = self.log_smooth - context_logden
+        ngram_logprobs = np.log(self.ngram_counts + self.smooth) \
+                            - np.repeat(context_logden, row_lengths)
+        ngram_keys = np.repeat(self.context_keys, row_lengths) * base \
+                        + self.next_token_ids
+        # the out of vocabulary next token has the largest id, so its\
+        # ngram closes the row of its left context. Any ngram with\
+        # a seen left context is then inserted in this row.
+        ends = self.row_ptr[1:]
+        self.lookup_keys = np.insert(ngram_keys, ends,
+                                        self.context_keys * base + (base - 1))
+        self.lookup_logprobs = np.insert(ngram_logprobs, ends,
+                                            unseen_logprobs).astype(np.float32)
+        self.lookup_context_keys = np.repeat(self.context_keys, row_lengths + 1)
+        self.lookup_unseen_logprobs = np.repeat(unseen_logprobs,
+                                                row_lengths + 1).astype(np.float32)
+
+    def _logprobs(self, context_keys: np.ndarray, ngram_keys: np.ndarray) -> np.ndarray:
+        """
+        Look up the log probabilities of packed ngrams.
+
+        Parameters
+        ----------
+        - context_keys: array of int
+            The packed left contexts of the ngrams.
+        - ngram_keys: array of int
+            The packed ngrams.
+
+        Return
+        ------
+        - array of float32:
+            The log probabilities of the ngrams.
+        """
+        rows = np.searchsorted(self.lookup_keys, ngram_keys)
+        np.minimum(rows, len(self.lookup_keys) - 1, out=rows)
+        # unseen next token in a seen left context only gets the smoothing,
+        # unknown left_context, return smoothed log probability
+        # (very small probability) instead of returning 0 probability
+        return np.where(self.lookup_keys[rows] == ngram_keys,
+                        self.lookup_logprobs[rows],
+                        np.where(self.lookup_context_keys[rows] == context_keys,
+                                    self.lookup_unseen_logprobs[rows],
+                                    self.log_unk))
+
     def ngram_probability(self, ngram: Ngram) -> float:
         """
         Assign a probability of a given ngram by using\
@@ -164,7 +587,7 @@ class NGramLanguageModel:
 
         Paramerers
         ----------
-        - ngram: Tuple of str
+        - ngram: str
             The ngram for which you want to assign a probability.
 
         Return
@@ -172,17 +595,25 @@ class NGramLanguageModel:
         - float:
             The assigned probability to the given ngram.
         """
-        *left_context, next_token = ngram
-        left_context = tuple(left_context)
-        left_context_seen = self.ngram_counter.get(left_context, False)
-        if not left_context_seen:
-            # unknown left_context, return smoothed probability
-            # (very small probability) instead of returning 0 probability
-            return self.smooth / self.denominator_smoother
-        denominator = sum(left_context_seen.values()) + self.denominator_smoother
-        # add also the smooth to the numerator, so all sums up to one.
-        numerator = self.ngram_counter[left_context].get(next_token, 0.0) + self.smooth
-        return numerator / denominator
+        return math.exp(self.ngram_logprob(ngram))
+
+    def ngram_logprob(self, ngram: Ngram) -> float:
+        """
+        Assign a log probability of a given ngram by using\
+        the precomputed log tables of the ngram language model.
+
+        Paramerers
+        ----------
+        - ngram: str
+            The ngram for which you want to assign a log probability.
+
+        Return
+        ------
+        - float:
+            The assigned log probability to the given ngram.
+        """
+        context_keys, ngram_keys = self._pack_ngrams(ngram)
+        return float(self._logprobs(context_keys, ngram_keys)[0])
 
     def assign_logprob(self, utterance: str) -> float:
         """
@@ -199,14 +630,174 @@ class NGramLanguageModel:
         - flot:
             The log probability of the utterance.
         """
-        ngrams_of_the_utterance = list(self.get_ngrams(utterance))
-        if not ngrams_of_the_utterance:
+        return self.assign_encoded_logprob(encode_utterance(utterance))
+
+    def assign_encoded_logprob(self, code_points: np.ndarray) -> float:
+        """
+        Assign a normalised log probability to an utterance\
+        already encoded with `encode_utterance`.
+
+        Parameters
+        ----------
+        - code_points: array of int
+            The code points of the utterance.
+
+        Return
+        ------
+        - flot:
+            The log probability of the utterance.
+        """
+        if self.pad_utterances :
+            code_points = _pad_code_points(code_points, self.ngram_size - 1)
+        context_keys, ngram_keys = self._pack_token_ids(self._token_ids(code_points))
+        if not len(ngram_keys):
             # This condition can holds only in the case pad_utterances\
             # is set to False.
             return False
-        ngram_values = np.array([self.ngram_probability(ngram)
-                                    for ngram in ngrams_of_the_utterance])
-        return np.sum(np.log(ngram_values)) / len(ngrams_of_the_utterance)
+        # sum the single precision log probabilities in double precision
+        logprobs = self._logprobs(context_keys, ngram_keys)
+        return float(logprobs.sum(dtype=np.float64)) / len(ngram_keys)
+
+class NGramLanguageModelStack:
+    """
+    This class merges ngram language models of several languages\
+    into a single table, so that an utterance is packed once and\
+    scored by all the models with one lookup.
+    The ngrams are packed over the union of the vocabularies of\
+    the models, and each column of the table holds the log probabilities\
+    of a ngram under all the models, the ones of the models that\
+    did not see this ngram being already resolved to their smoothed\
+    values. The log probabilities are quantized on 16 bits, so the\
+    scores are the ones of the single models up to about 1e-4.
+
+    Parameters
+    ----------
+    - models: list of NGramLanguageModel
+        The trained models, all with the same ngram size and padding.
+    """
+    def __init__(self, models: List[NGramLanguageModel]):
+        if len({(model.ngram_size, model.pad_utterances) for model in models}) > 1:
+            raise ValueError("The models don't have the same ngram size and padding.")
+        self.languages: List[str] = [model.language for model in models]
+        self.ngram_size: int = models[0].ngram_size
+        self.pad_utterances: bool = models[0].pad_utterances
+        self.code_points = np.unique(np.concatenate([model.code_points for model in models]))
+        self.base: int = len(self.code_points) + 1
+        if self.base ** self.ngram_size >= 2 ** 63:
+            raise ValueError("The ngrams are too long to be packed in 64 bits.")
+        ngram_keys, ngram_logprobs, context_keys, unseen_logprobs = zip(
+                                        *(self._repack_model(model) for model in models))
+        # log probability of a ngram with an unknown left context, per model
+        self.log_unk = np.array([model.log_unk for model in models], dtype=np.float32)
+        # left contexts seen by at least a model, with the log probability\
+        # of an unseen next token after them under each model.
+        union_context_keys = np.unique(np.concatenate(context_keys))
+        union_unseen_logprobs = np.repeat(self.log_unk[:, None], len(union_context_keys), axis=1)
+        for model_index, (keys, logprobs) in enumerate(zip(context_keys, unseen_logprobs)):
+            union_unseen_logprobs[model_index, np.searchsorted(union_context_keys, keys)] = logprobs
+        # ngrams seen by at least a model, with their log probabilities under\
+        # each model.
+        union_ngram_keys = np.unique(np.concatenate(ngram_keys))
+        union_ngram_logprobs = union_unseen_logprobs[:, np.searchsorted(union_context_keys,
+                                                        union_ngram_keys // self.base)]
+        for model_index, (keys, logprobs) in enumerate(zip(ngram_keys, ngram_logprobs)):
+            union_ngram_logprobs[model_index, np.searchsorted(union_ngram_keys, keys)] = logprobs
+        # as in the single models, the ngram of the out of vocabulary next\
+        # token closes the row of each left context and holds the log\
+        # probabilities of an unseen next token, so that a ngram is resolved\
+        # with a single binary search. The last column of the table holds\
+        # the log probabilities of an unknown left context.
+        lookup_keys = np.concatenate((union_ngram_keys,
+                                        union_context_keys * self.base + (self.base - 1)))
+        order = np.argsort(lookup_keys, kind="stable")
+        self.lookup_keys = lookup_keys[order]
+        lookup_logprobs = np.concatenate((union_ngram_logprobs,
+                                            union_unseen_logprobs,
+                                            self.log_unk[:, None]), axis=1)
+        lookup_logprobs = lookup_logprobs[:, np.append(order, len(order))]
+        # each model gets its own scale and offset. 8 bits would be too\
+        # coarse: they change the identified language of close texts.
+        self.offsets = lookup_logprobs.min(axis=1).astype(np.float64)
+        self.scales = (lookup_logprobs.max(axis=1) - self.offsets) / QUANTIZATION_LEVELS
+        self.scales[self.scales == 0] = 1.0
+        self.lookup_levels = np.round((lookup_logprobs - self.offsets[:, None])
+                                        / self.scales[:, None]).astype(np.uint16)
+        # column closing the row of the left context of each lookup key
+        self.lookup_sentinels = np.searchsorted(
+                                    self.lookup_keys,
+                                    self.lookup_keys - self.lookup_keys % self.base + (self.base - 1))
+
+    def _repack_model(self, model: NGramLanguageModel) -> Tuple[np.ndarray, ...]:
+        """
+        Pack again the seen ngrams and left contexts of a model\
+        over the union of the vocabularies.
+
+        Parameters
+        ----------
+        - model: NGramLanguageModel
+            The trained model.
+
+        Return
+        ------
+        - Tuple of arrays:
+            The packed seen ngrams and their log probabilities, and the\
+            packed seen left contexts and the log probabilities of an\
+            unseen next token after them.
+        """
+        model_base = model._base()
+        # the sentinel keys closing the left contexts carry their\
+        # unseen next token log probabilities
+        sentinels = model.lookup_keys % model_base == model_base - 1
+        token_ids = np.searchsorted(self.code_points, model.code_points)
+        repacked = []
+        for keys, number_of_tokens in ((model.lookup_keys[~sentinels], self.ngram_size),
+                                        (model.context_keys, self.ngram_size - 1)):
+            repacked_keys = np.zeros(len(keys), dtype=np.int64)
+            scale = 1
+            for _ in range(number_of_tokens):
+                keys, digits = np.divmod(keys, model_base)
+                repacked_keys += token_ids[digits] * scale
+                scale *= self.base
+            repacked.append(repacked_keys)
+        return (repacked[0], model.lookup_logprobs[~sentinels],
+                repacked[1], model.lookup_logprobs[sentinels])
+
+    def assign_encoded_logprobs(self, code_points: np.ndarray) -> np.ndarray:
+        """
+        Assign to an utterance already encoded with `encode_utterance`\
+        its normalised log probability under each model.
+
+        Parameters
+        ----------
+        - code_points: array of int
+            The code points of the utterance.
+
+        Return
+        ------
+        - array of float:
+            The log probabilities of the utterance, in the order\
+            of the languages.
+        """
+        if self.pad_utterances :
+            code_points = _pad_code_points(code_points, self.ngram_size - 1)
+        context_keys, ngram_keys = _pack_token_ids(
+                                        _lookup_token_ids(self.code_points, code_points),
+                                        self.base,
+                                        self.ngram_size)
+        if not len(ngram_keys):
+            return np.zeros(len(self.languages))
+        rows = np.searchsorted(self.lookup_keys, ngram_keys)
+        np.minimum(rows, len(self.lookup_keys) - 1, out=rows)
+        # the unseen ngrams fall back on the row closing their left\
+        # context, or on the last column if the context is unknown
+        columns = np.where(self.lookup_keys[rows] == ngram_keys,
+                            rows,
+                            np.where(self.lookup_keys[rows] // self.base == context_keys,
+                                        self.lookup_sentinels[rows],
+                                        len(self.lookup_keys)))
+        # sum the levels exactly, then scale their mean back
+        levels = self.lookup_levels[:, columns].sum(axis=1, dtype=np.int64)
+        return levels * self.scales / len(ngram_keys) + self.offsets
 
 def main(args) -> None:
     """This function will train and save the ngram language model."""
@@ -215,7 +806,10 @@ def main(args) -> None:
                                     ngram_size=args.ngram_size,
                                     smooth=args.smooth)
     ngram_lm.estimate(args.train_file)
-    ngram_lm.save_model(args.out_directory, args.out_filename)
+    if args.out_format == "npy":
+        ngram_lm.save_model_npy(args.out_directory, args.out_filename)
+    else:
+        ngram_lm.save_model(args.out_directory, args.out_filename)
 
 if __name__ == "__main__" :
     parser = ArgumentParser()
@@ -252,4 +846,10 @@ if __name__ == "__main__" :
     parser.add_argument("--out_filename",
                         help="The filename for the model.",
                         required=True)
+    parser.add_argument("--out_format",
+                        choices=["json", "npy"],
+                        default="npy",
+                        help="Store the model in a JSON file or in a directory\
+                            of NumPy arrays that are loaded without parsing.",
+                        required=False)
     main(parser.parse_args())
@@ -3,23 +3,235 @@
     other direction too"""
 
 # python standard packages
-from typing import Tuple, Dict, Set
+from typing import Tuple, Dict, Set, List, Optional, Iterable
 import os
+import json
+import tempfile
 from pathlib import Path
 import time
 import logging
-from collections import Counter
+from collections import Counter, OrderedDict
 import re
-from math import inf
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Lock
 
 # installed packages
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tweepy
-from tweepy.models import Status
 from tweepy import Cursor
+from tweepy.models import Status
 
 # local modules
-from ngram_lm import NGramLanguageModel
+from ngram_lm import NGramLanguageModel, NGramLanguageModelStack, encode_utterance
+
+# twitter language codes of the languages handled by the bot\
+# and their corresponding NLLB codes.
+LANGUAGES: MappingProxyType = MappingProxyType({
+                                                "ff" : "fuv_Latn",
+                                                "fr" : "fra_Latn",
+                                                "en" : "eng_Latn",
+                                                "ar" : "arb_Arab"
+                                                })
+# code point ranges of the letters of the scripts of the handled\
+# languages, sorted and not overlapping: (first, last, script).
+SCRIPT_RANGES: Tuple[Tuple[int, int, str], ...] = (
+                                                    (0x0041, 0x005A, "Latn"),
+                                                    (0x0061, 0x007A, "Latn"),
+                                                    (0x00C0, 0x02AF, "Latn"),
+                                                    (0x0600, 0x06FF, "Arab"),
+                                                    (0x0750, 0x077F, "Arab"),
+                                                    (0x08A0, 0x08FF, "Arab"),
+                                                    (0x1E00, 0x1EFF, "Latn"),
+                                                    (0xFB50, 0xFDFF, "Arab"),
+                                                    (0xFE70, 0xFEFF, "Arab"),
+                                                    (0x1E900, 0x1E95F, "Adlm")
+                                                    )
+# the languages that can be written in each script
+SCRIPT_LANGUAGES: MappingProxyType = MappingProxyType({
+                                                        "Latn" : ("ff", "fr", "en"),
+                                                        "Arab" : ("ar",),
+                                                        "Adlm" : ("ff",)
+                                                        })
+# an even position in these bounds means outside of any script range
+_SCRIPT_BOUNDS = np.array([bound for first, last, _ in SCRIPT_RANGES
+                                    for bound in (first, last + 1)], dtype=np.uint32)
+# twitter language codes of the tweets whose language was not identified
+UNDETERMINED_LANGUAGES: frozenset = frozenset({"und", "zxx", "qam", "qct", "qht", "qme", "qst"})
+# texts shorter than this are too short for the ngram language models:\
+# twitter does not know Fulfulde and gives another language to the\
+# short Fulfulde tweets, so they are taken as Fulfulde.
+SHORT_TEXT_LENGTH: int = 30
+# the twitter account of the bot
+BOT_SCREEN_NAME: str = "firtanam_"
+# the mentions of twitter accounts in a tweet
+MENTION_PATTERN: re.Pattern = re.compile(r"\B@\w+")
+# seconds during which the language of a user is not fetched again
+USER_LANGUAGE_TTL: int = 86_400
+# number of recent tweets of a user from which to find their language,\
+# and number of tweets fetched when they don't show a clear majority.
+USER_TIMELINE_SAMPLE: int = 20
+USER_TIMELINE_FALLBACK: int = 200
+# maximum number of users whose language is cached
+USER_LANGUAGE_CACHE_SIZE: int = 2_048
+# seconds to wait for connecting to the translator and for its answer
+TRANSLATOR_TIMEOUT: Tuple[int, int] = (3, 30)
+# retries of a translation request that failed to connect, timed out\
+# or met an unavailable translator, with an exponential backoff.
+TRANSLATOR_RETRY: Retry = Retry(total=3,
+                                backoff_factor=0.5,
+                                status_forcelist=(502, 503, 504),
+                                allowed_methods=frozenset({"POST"}),
+                                raise_on_status=False)
+# where the replied mentions are kept between two runs of the bot
+REPLIED_MENTIONS_FILE: Path = Path("replied_mentions.json")
+# number of new replies after which the replied mentions are saved
+SAVE_REPLIED_MENTIONS_EVERY: int = 10
+# maximum number of tweets fetched by a single statuses/lookup request
+LOOKUP_BATCH_SIZE: int = 100
+# seconds to wait before fetching again mentions whose lookup failed
+LOOKUP_RETRY_DELAY: int = 5
+# number of added tweet ids after which they are merged into the sorted ones
+TWEET_IDS_MERGE_SIZE: int = 256
+# maximum number of pending mentions handled concurrently
+TRANSLATION_BATCH_SIZE: int = 8
+
+def load_ngram_model(path: Path) -> NGramLanguageModel:
+    """Load a trained ngram language model, stored either in a JSON\
+    file or in a directory of NumPy arrays by `save_model_npy`."""
+    model = NGramLanguageModel()
+    if path.is_dir():
+        model.load_model_npy(path)
+    else:
+        model.load_model(path)
+    return model
+
+class MentionStream(tweepy.StreamingClient):
+    """
+    Filtered stream pushing the ids of the tweets\
+    mentioning the bot into a queue as they are posted.
+
+    Parameters
+    ----------
+    - bearer_token: str
+        The bearer token for the twitter API v2.
+    - mentions: Queue
+        The queue where to put the ids of the mentions\
+        with the ids of the tweets they reply to.
+    """
+    def __init__(self, bearer_token: str, mentions: Queue):
+        super().__init__(bearer_token, wait_on_rate_limit=True)
+        self.mentions = mentions
+
+    def on_tweet(self, tweet: tweepy.Tweet) -> None:
+        """Queue the id of a new mention and the id of the tweet it replies to."""
+        replied_to_id: Optional[int] = next((referenced_tweet.id
+                                            for referenced_tweet in tweet.referenced_tweets or []
+                                            if referenced_tweet.type == "replied_to"), None)
+        self.mentions.put((tweet.id, replied_to_id))
+
+class TweetIds:
+    """
+    Set of tweet ids stored in a sorted array of 64 bits integers,\
+    which takes a fraction of the memory of a set of python integers.
+    The ids added since the last merge wait in a small set.
+
+    Parameters
+    ----------
+    - tweet_ids: iterable of int
+        The initial tweet ids.
+    """
+    def __init__(self, tweet_ids: Iterable[int]=()):
+        self.sorted_ids = np.unique(np.fromiter(tweet_ids, dtype=np.int64))
+        self.new_ids: Set[int] = set()
+
+    def __contains__(self, tweet_id: int) -> bool:
+        if tweet_id in self.new_ids:
+            return True
+        position = np.searchsorted(self.sorted_ids, tweet_id)
+        return position < len(self.sorted_ids) and self.sorted_ids[position] == tweet_id
+
+    def __len__(self) -> int:
+        return len(self.sorted_ids) + len(self.new_ids)
+
+    def add(self, tweet_id: int) -> None:
+        """Add a tweet id."""
+        if tweet_id in self:
+            return
+        self.new_ids.add(tweet_id)
+        if len(self.new_ids) >= TWEET_IDS_MERGE_SIZE:
+            self.merge()
+
+    def update(self, tweet_ids: Iterable[int]) -> None:
+        """Add several tweet ids at once."""
+        self.merge()
+        self.sorted_ids = np.union1d(self.sorted_ids,
+                                        np.fromiter(tweet_ids, dtype=np.int64))
+
+    def merge(self) -> None:
+        """Merge the added tweet ids into the sorted ones."""
+        if self.new_ids:
+            self.sorted_ids = np.union1d(self.sorted_ids,
+                                            np.fromiter(self.new_ids, dtype=np.int64))
+            self.new_ids.clear()
+
+    def newest(self) -> int:
+        """The most recent tweet id, 0 if there is none."""
+        return max(int(self.sorted_ids[-1]) if len(self.sorted_ids) else 0,
+                    max(self.new_ids, default=0))
+
+    def tolist(self) -> List[int]:
+        """The sorted tweet ids."""
+        self.merge()
+        return self.sorted_ids.tolist()
+
+def get_scripts(code_points: np.ndarray) -> Set[str]:
+    """
+    Return the scripts of the letters of an encoded text.
+
+    Parameters
+    ----------
+    - code_points: array of int
+        The code points of the text.
+
+    Return
+    ------
+    - set of str:
+        The scripts of SCRIPT_RANGES used by the text.
+    """
+    positions = np.searchsorted(_SCRIPT_BOUNDS, code_points, side="right")
+    ranges = np.unique(positions[positions % 2 == 1] // 2)
+    return {SCRIPT_RANGES[index][2] for index in ranges.tolist()}
+
+def is_made_of_mentions(status: Status) -> bool:
+    """
+    Whether or not a tweet is made only of mentions. The mentions\
+    found by twitter are used first, the mention pattern being\
+    matched only when they don't cover the tweet.
+
+    Parameters
+    ----------
+    - status: Status
+        The tweet to check.
+
+    Return
+    ------
+    - bool:
+        Whether or not the tweet holds nothing but mentions.
+    """
+    text: str = status.full_text
+    mentions_length = sum(end - start for start, end in
+                            (user_mention["indices"] for user_mention
+                                in status.entities.get("user_mentions", [])))
+    # the mentions hold no whitespaces, so they cover all the\
+    # other characters of a tweet made only of mentions.
+    if mentions_length == len("".join(text.split())):
+        return True
+    return not MENTION_PATTERN.sub("", text).strip()
 
 class TranslatorTwitterBot:
     """
@@ -45,6 +257,11 @@ class TranslatorTwitterBot:
         The secret token for the twitter API.
     - translator: str
         The translator model.
+    - ngram_models_folder: str
+        The folder of the trained ngram language models.
+    - bearer_token: str
+        The bearer token for the twitter API v2, used to\
+        stream the mentions of the bot.
     """
     def __init__(self,
                     api_key: str,
@@ -52,25 +269,54 @@ class TranslatorTwitterBot:
                     access_token: str,
                     secret_access_token: str,
                     translator: str,
-                    ngram_models_folder: str):
+                    ngram_models_folder: str,
+                    bearer_token: str):
 
-            self.languages: Dict[str, str]  = {
-                                                "ff" : "fuv_Latn",
-                                                "fr" : "fra_Latn",
-                                                "en" : "eng_Latn",
-                                                "ar" : "arb_Arab"
-                                                }
             self.api_key: str = api_key
             self.api_secret_key: str = api_secret_key
             self.access_token: str = access_token
             self.secret_access_token: str = secret_access_token
+            self.bearer_token: str = bearer_token
             self.translator = translator
-            self.ngram_models = [NGramLanguageModel() for _ in self.languages]
-            trained_models = list(Path(ngram_models_folder).glob("*.json"))
+            # keep the connections to the translator alive between requests
+            self._http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=TRANSLATION_BATCH_SIZE,
+                                    pool_maxsize=TRANSLATION_BATCH_SIZE,
+                                    max_retries=TRANSLATOR_RETRY)
+            self._http.mount("https://", adapter)
+            self._http.mount("http://", adapter)
+            # the pending mentions are handled concurrently
+            self._workers = ThreadPoolExecutor(max_workers=TRANSLATION_BATCH_SIZE)
+            # id of the most recent tweet of the bot already scanned
             self.since_id = 0
-            for trained_model, model in zip(trained_models, self.ngram_models):
-                model.load_model(trained_model)
-            self._init_twitter_api()
+            # id of the most recent mention of the bot already handled
+            self.mentions_since_id = 0
+            self.load_replied_mentions()
+            # user id -> (most used language, time it was fetched),\
+            # from the least to the most recently used.
+            self._user_languages: OrderedDict = OrderedDict()
+            self._user_languages_lock = Lock()
+            model_paths: Dict[str, Path] = {model_file.stem: model_file for model_file in
+                                            Path(ngram_models_folder).glob("*.json")}
+            for hyperparameters_file in Path(ngram_models_folder).glob("*/hyperparameters.json"):
+                model_directory = hyperparameters_file.parent
+                model_file = model_paths.get(model_directory.name)
+                # the models stored as NumPy arrays are preferred over\
+                # their JSON version, unless the JSON file is newer.
+                if model_file is not None \
+                    and model_file.stat().st_mtime > hyperparameters_file.stat().st_mtime:
+                    logging.warning(f"{model_file} is newer than {model_directory} and is loaded"
+                                    " instead, run convert_models.py to update the arrays.")
+                    continue
+                model_paths[model_directory.name] = model_directory
+            trained_models: List[Path] = [model_paths[name] for name in sorted(model_paths)]
+            # load the models in parallel while the twitter API is set up
+            with ThreadPoolExecutor(max_workers=len(trained_models) or None) as executor:
+                ngram_models = executor.map(load_ngram_model, trained_models)
+                self._init_twitter_api()
+                self.ngram_models: List[NGramLanguageModel] = list(ngram_models)
+            # all the models score a text with a single lookup
+            self.ngram_model_stack = NGramLanguageModelStack(self.ngram_models)
 
     def _init_twitter_api(self) -> None:
         """Authentificate the twitter API given according to the given token"""
@@ -78,50 +324,111 @@ class TranslatorTwitterBot:
         auth.set_access_token(self.access_token, self.secret_access_token)
         self.api: tweepy.API = tweepy.API(auth, wait_on_rate_limit=True)
 
-    def get_user_language(self, user_id: int) -> str:
+    def get_user_language(self, user_id: int, profile_language: Optional[str]=None) -> str:
         """
         Will return the language the most used\
-        by a twitter user.
+        by a twitter user. The language of the profile of the user\
+        is used when twitter gives it, otherwise the language is\
+        found from the last tweets of the user. The languages of\
+        the USER_LANGUAGE_CACHE_SIZE most recent users are cached\
+        for USER_LANGUAGE_TTL seconds.
 
         Parameters
         ----------
         - user_id: int
             The user id for which to get the language
+        - profile_language: str
+            The language of the profile of the user, if any.
         
         Return
         ------
         - str
-            The language the most used by the twitter user.
+            The language the most used by the twitter user, 'und'\
+            if it could not be found.
         """
-        tweets = self.api.user_timeline(user_id=user_id,
-                                        count=1_000,
-                                        include_rts = False,
-                                        exclude_replies=False,
-                                        tweet_mode = 'extended')
-        
-        return Counter(tweet.lang for tweet in tweets).most_common(1)[0][0]
+        if profile_language:
+            return profile_language
+        with self._user_languages_lock:
+            cached = self._user_languages.get(user_id)
+            if cached is not None and time.monotonic() - cached[1] < USER_LANGUAGE_TTL:
+                self._user_languages.move_to_end(user_id)
+                return cached[0]
+        for count in (USER_TIMELINE_SAMPLE, USER_TIMELINE_FALLBACK):
+            try:
+                tweets = self.api.user_timeline(user_id=user_id,
+                                                count=count,
+                                                include_rts = False,
+                                                exclude_replies=False,
+                                                tweet_mode = 'extended')
+            except tweepy.TweepyException:
+                # protected account, etc. This is not cached so that\
+                # the language is fetched again next time.
+                return "und"
+            # the tweets without language don't tell anything about the user
+            languages = Counter(tweet.lang for tweet in tweets
+                                if tweet.lang not in UNDETERMINED_LANGUAGES)
+            # ties go to the language seen first, as with most_common
+            language = max(languages, key=languages.__getitem__, default=None)
+            if language is not None and 2 * languages[language] > sum(languages.values()):
+                break
+            if len(tweets) < count:
+                # there are no more tweets to fetch
+                break
+        if language is None:
+            # the user has no tweets yet
+            return "und"
+        with self._user_languages_lock:
+            self._user_languages[user_id] = (language, time.monotonic())
+            self._user_languages.move_to_end(user_id)
+            if len(self._user_languages) > USER_LANGUAGE_CACHE_SIZE:
+                self._user_languages.popitem(last=False)
+        return language
     
-    def language_identifier(self, text) -> str:
+    def language_identifier(self, text, twitter_language: str="und") -> str:
         """
         Try identifying language by using ngram language.
         Next version : using a neural model for this task.
+        The text is only scored by the models of the languages\
+        that can be written in its script, and not scored at all\
+        when a single language can or when it is a short text\
+        to which twitter gave a language the bot does not handle.
 
         Parameters
         ----------
         - text: str
             Text for which to identify the language.
+        - twitter_language: str
+            The language twitter identified for the text.
         
         Return
         ------
         - str:
             The identified language.
         """
-        return max((model.assign_logprob(text), model.language)
-                    for model in self.ngram_models)[1]
+        # the text is encoded once and scored by all the models
+        code_points = encode_utterance(text)
+        languages = self.ngram_model_stack.languages
+        candidates = list(range(len(languages)))
+        scripts = get_scripts(code_points)
+        if len(scripts) == 1:
+            # mixed scripts are scored by all the models
+            script_languages = SCRIPT_LANGUAGES[scripts.pop()]
+            candidates = [index for index in candidates
+                            if languages[index] in script_languages] or candidates
+            if len(candidates) == 1:
+                return languages[candidates[0]]
+        if twitter_language not in UNDETERMINED_LANGUAGES \
+            and len(code_points) < SHORT_TEXT_LENGTH \
+            and "ff" in (languages[index] for index in candidates):
+            return "ff"
+        scores = self.ngram_model_stack.assign_encoded_logprobs(code_points)
+        return languages[candidates[int(scores[candidates].argmax())]]
                     
     def get_src_tgt_languages(self,
                                 tweet_status: Status,
                                 user_id: int,
+                                tweet_text: Optional[str]=None,
+                                profile_language: Optional[str]=None
                                 ) -> Tuple[str]:
         """
         This function will determinate the direction of the translation\
@@ -135,6 +442,10 @@ class TranslatorTwitterBot:
             for translating it.
         - user_id: int
             The user that produced the tweet.
+        - tweet_text: str
+            The stripped text of the tweet, if already computed.
+        - profile_language: str
+            The language of the profile of the user, if any.
             
         Returns
         -------
@@ -143,59 +454,162 @@ class TranslatorTwitterBot:
             translation and the second element is the language in which\
             the tweet is to be translated.
         """
-        language: str = tweet_status.lang
-        if language in self.languages :
-            src: str = self.languages[language]
-            tgt: str = "fuv_Latn"
-        else :
-            # identify the source language
-            src: str = self.language_identifier(tweet_status.full_text.strip())
-            src: str = self.languages[src]
-            tgt: str = self.get_user_language(user_id)
-            # if the target language id not in the considered languages,
-            # then we translate the tweet in french by default.
-            if tgt not in self.languages:
-                tgt: str = "fra_Latn"
-                return src, tgt
-            tgt: str = self.languages[tgt]
-        return src, tgt
+        src = LANGUAGES.get(tweet_status.lang)
+        if src is not None:
+            return src, "fuv_Latn"
+        # identify the source language
+        if tweet_text is None:
+            tweet_text = tweet_status.full_text.strip()
+        src_language: str = self.language_identifier(tweet_text, tweet_status.lang)
+        user_language: str = self.get_user_language(user_id, profile_language)
+        # if the target language id not in the considered languages,
+        # then we translate the tweet in french by default.
+        return LANGUAGES[src_language], LANGUAGES.get(user_language, "fra_Latn")
     
-    def get_already_replied_mentions(self):
-        """Get mentions already replied by the bot."""
-        already_replied_mentions: Set[int] = set()
+    def load_replied_mentions(self) -> None:
+        """Load the mentions replied during the previous runs of the bot, if any."""
+        self.replied_mentions = TweetIds()
+        if not REPLIED_MENTIONS_FILE.exists():
+            return
+        with open(REPLIED_MENTIONS_FILE, "r", encoding="utf-8") as replied_mentions_file:
+            replied_mentions = json.load(replied_mentions_file)
+        self.since_id = replied_mentions["since_id"]
+        self.mentions_since_id = replied_mentions.get("mentions_since_id", 0)
+        self.replied_mentions = TweetIds(replied_mentions["replied_mentions"])
+
+    def save_replied_mentions(self) -> None:
+        """
+        Save the replied mentions. The file is written aside\
+        and then renamed so a crash never leaves it truncated.
+        """
+        with tempfile.NamedTemporaryFile("w",
+                                        encoding="utf-8",
+                                        dir=REPLIED_MENTIONS_FILE.resolve().parent,
+                                        suffix=".tmp",
+                                        delete=False) as temporary_file:
+            json.dump({"since_id" : self.since_id,
+                        "mentions_since_id" : self.mentions_since_id,
+                        "replied_mentions" : self.replied_mentions.tolist()},
+                        temporary_file)
+        os.replace(temporary_file.name, REPLIED_MENTIONS_FILE)
+
+    def get_already_replied_mentions(self) -> TweetIds:
+        """
+        Get mentions already replied by the bot. Only the tweets\
+        posted by the bot since the last run are fetched, the\
+        older ones are loaded from REPLIED_MENTIONS_FILE.
+        """
+        already_replied_mentions: TweetIds = self.replied_mentions
+        replied_ids: Set[int] = set()
         for status in self.api.user_timeline(count=3_000,
-                                                screen_name="firtanam_"):
+                                                screen_name=BOT_SCREEN_NAME,
+                                                since_id=self.since_id or None):
+            self.since_id = max(self.since_id, status.id)
             if status.in_reply_to_status_id:
-                # handle deleted tweet, private accounts, etc.
-                try:
-                    source_tweet_status: Status = self.api.get_status(
-                                                    status.in_reply_to_status_id,
-                                                    tweet_mode="extended")
-                    already_replied_mentions.add(source_tweet_status.id)
-                except:
-                    continue
+                replied_ids.add(status.in_reply_to_status_id)
+        replied_ids = sorted(replied_id for replied_id in replied_ids
+                                if replied_id not in already_replied_mentions)
+        # the deleted tweets, the private accounts, etc. are not returned
+        for start in range(0, len(replied_ids), LOOKUP_BATCH_SIZE):
+            batch = replied_ids[start:start + LOOKUP_BATCH_SIZE]
+            try:
+                already_replied_mentions.update(status.id for status in
+                                                self.api.lookup_statuses(batch,
+                                                                        include_entities=False,
+                                                                        trim_user=True))
+            except tweepy.TweepyException:
+                # fall back on fetching the tweets one by one
+                for replied_id in batch:
+                    try:
+                        already_replied_mentions.add(self.api.get_status(replied_id).id)
+                    except tweepy.TweepyException:
+                        continue
+        self.save_replied_mentions()
         return already_replied_mentions
 
-    def get_status_data(self, status) -> Dict[str, str]:
+    def add_replied_mention(self, mention_id: int) -> None:
+        """Record a replied mention, the replied mentions being\
+        saved every SAVE_REPLIED_MENTIONS_EVERY replies."""
+        self.replied_mentions.add(mention_id)
+        if len(self.replied_mentions) % SAVE_REPLIED_MENTIONS_EVERY == 0:
+            self.save_replied_mentions()
+
+    def answer_missed_mentions(self, already_replied_mentions: TweetIds) -> None:
+        """
+        Answer the mentions posted while the bot was not running,\
+        from the oldest to the most recent one. Nothing is fetched\
+        before the first mention the bot handles.
+
+        Parameters
+        ----------
+        - already_replied_mentions: TweetIds
+            The mentions already replied by the bot.
+        """
+        since_id: int = self.mentions_since_id or already_replied_mentions.newest()
+        if not since_id:
+            return
+        missed_mentions: List[Status] = [mention for mention in
+                                            Cursor(self.api.mentions_timeline,
+                                                    since_id=since_id,
+                                                    count=200,
+                                                    tweet_mode="extended").items()
+                                            if mention.id not in already_replied_mentions]
+        # fetch the tweets the missed mentions reply to in batches
+        replied_ids = sorted({mention.in_reply_to_status_id for mention in missed_mentions
+                                if mention.in_reply_to_status_id})
+        source_tweets: Dict[int, Status] = {}
+        for start in range(0, len(replied_ids), LOOKUP_BATCH_SIZE):
+            try:
+                source_tweets.update((status.id, status) for status in
+                                        self.api.lookup_statuses(
+                                            replied_ids[start:start + LOOKUP_BATCH_SIZE],
+                                            tweet_mode="extended"))
+            except tweepy.TweepyException:
+                # the source tweets will be fetched one by one
+                continue
+        missed_mentions.reverse()
+        for start in range(0, len(missed_mentions), TRANSLATION_BATCH_SIZE):
+            batch = missed_mentions[start:start + TRANSLATION_BATCH_SIZE]
+            replied = self.handle_mentions([(mention,
+                                            source_tweets.get(mention.in_reply_to_status_id))
+                                            for mention in batch])
+            for mention, is_replied in zip(batch, replied):
+                if is_replied:
+                    self.add_replied_mention(mention.id)
+            self.mentions_since_id = max(self.mentions_since_id, batch[-1].id)
+
+    def get_status_data(self,
+                        status: Status,
+                        source_tweet_status: Optional[Status]=None) -> Dict[str, str]:
         """The bot checks its mentions timeline and collect\
-        all the needed informations to perform his task."""
+        all the needed informations to perform his task.
+        The tweet the mention replies to is fetched only\
+        if it is not given."""
 
-        # not reply to not empty tweet.
-        if re.sub("\B\@\w+", "", status.full_text).strip():
+        # not reply to not empty tweet: the bot is called by a tweet\
+        # made only of mentions.
+        if not is_made_of_mentions(status):
             return None
         if status.in_reply_to_status_id:
-            try:
-                # handle remove tweets, provate accounts, etd.
-                source_tweet_status: Status = self.api.get_status(status.in_reply_to_status_id,
-                                                                    tweet_mode="extended")
-            except:
-                return None
             mention_username: str = status.user.screen_name
-            # not reply to self mentionning
-            if mention_username == "firtanam_":
+            # not reply to self mentionning, checked before fetching anything
+            if mention_username == BOT_SCREEN_NAME:
                 return None
-            src, tgt = self.get_src_tgt_languages(source_tweet_status, status.user.id_str)
+            if source_tweet_status is None:
+                try:
+                    # handle remove tweets, provate accounts, etd.
+                    source_tweet_status = self.api.get_status(status.in_reply_to_status_id,
+                                                                tweet_mode="extended")
+                except:
+                    return None
+            # the text is stripped once for the language identification\
+            # and the translation
             source_text_tweet: str = source_tweet_status.full_text.strip()
+            # the language of the profiles is not given anymore by the API v1.1
+            src, tgt = self.get_src_tgt_languages(source_tweet_status,
+                                                    status.user.id_str,
+                                                    source_text_tweet,
+                                                    getattr(status.user, "lang", None))
 
             return {
                 "src_language" : src,
@@ -209,14 +623,16 @@ class TranslatorTwitterBot:
         """Request translation of given text from source language to a target language."""
 
         inputs = {"data": [src_language, tgt_language, text_to_translate, 270]}
-        for _ in range(10) :
-            try:
-                response = requests.post(self.translator,
-                                        json=inputs)
-                return response.json()["data"][0]
-            except:
-                continue
-        return "Mi ronkii firtude 🥲"
+        # the session adapter retries the failed requests
+        try:
+            response = self._http.post(self.translator,
+                                        json=inputs,
+                                        timeout=TRANSLATOR_TIMEOUT)
+            response.raise_for_status()
+            return response.json()["data"][0]
+        except (requests.RequestException, ValueError, KeyError, IndexError) as error:
+            logging.info(f"Translation request failed: {error}")
+            return "Mi ronkii firtude 🥲"
         
         
     def reply_to_the_tweet(self,
@@ -250,37 +666,119 @@ class TranslatorTwitterBot:
             logging.info(f"Could not reply this: {text_to_reply}, length: {len(text_to_reply)}")
             return None
     
+    def handle_mention(self,
+                        mention: Status,
+                        source_tweet_status: Optional[Status]=None) -> bool:
+        """
+        Translate the tweet under which the bot is mentioned\
+        and reply the translation to the mention.
+
+        Parameters
+        ----------
+        - mention: Status
+            The tweet mentioning the bot.
+        - source_tweet_status: Status
+            The tweet the mention replies to, if already fetched.
+
+        Return
+        ------
+        - bool:
+            Whether or not the bot replied to the mention.
+        """
+        try:
+            mention_data = self.get_status_data(mention, source_tweet_status)
+            if not mention_data :
+                logging.info("Mentions, but no tweet to translate.")
+                return False
+            traslated_tweet = self.translate(
+                                src_language=mention_data["src_language"],
+                                tgt_language=mention_data["tgt_language"],
+                                text_to_translate=mention_data["translate_this_text"]
+                                )
+            return self.reply_to_the_tweet(
+                        text_to_reply=traslated_tweet,
+                        tweet_to_reply=mention_data["reply_to_this_tweet"]) is not None
+        except Exception:
+            # a single bad tweet must not stop the bot
+            logging.exception(f"Could not handle the mention {mention.id}.")
+            return False
+
+    def handle_mentions(self,
+                        mentions: List[Tuple[Status, Optional[Status]]]) -> List[bool]:
+        """
+        Translate the tweets under which the bot is mentioned\
+        and reply the translations to the mentions. The mentions\
+        are handled concurrently, so that a mention waiting for\
+        the translator or for twitter does not hold the others.
+
+        Parameters
+        ----------
+        - mentions: list of tuples
+            The tweets mentioning the bot with the tweets they reply to,\
+            if already fetched.
+
+        Return
+        ------
+        - list of bool:
+            Whether or not the bot replied to each mention.
+        """
+        return list(self._workers.map(lambda mention: self.handle_mention(*mention),
+                                        mentions))
+
     def run_bot(self) -> None:
-        """Run the bot by calling all the necessary functions here!"""
-        since_id = 1585009197304803328
-        already_replied_mentions: Set[int] = self.get_already_replied_mentions()
+        """
+        Run the bot by calling all the necessary functions here!
+        The mentions are pushed by a filtered stream, so the bot\
+        sleeps until someone mentions it instead of polling\
+        its mentions timeline. The mentions timeline is only read\
+        once, for the mentions missed while the bot was not running.
+        """
+        # wake the translator up while the replied mentions are fetched,\
+        # so that the first mention does not wait for its cold start.
+        self._workers.submit(self.translate, "eng_Latn", "fuv_Latn", "Hello")
+        already_replied_mentions: TweetIds = self.get_already_replied_mentions()
+        mentions: Queue = Queue()
+        stream = MentionStream(self.bearer_token, mentions)
+        rule = f"@{BOT_SCREEN_NAME}"
+        if rule not in {stream_rule.value for stream_rule in stream.get_rules().data or []}:
+            stream.add_rules(tweepy.StreamRule(rule))
+        stream.filter(threaded=True, tweet_fields=["referenced_tweets"])
+        # the new mentions wait in the queue during the backfill
+        self.answer_missed_mentions(already_replied_mentions)
         while True:
-            for mention in Cursor(self.api.mentions_timeline,
-                                    since_id=since_id,
-                                    tweet_mode='extended').items():
-                mention_id = mention.id
-                condition_to_skeep_this_mention: bool = ((mention_id in already_replied_mentions) or
-                                                        (re.sub("\B\@\w+", "", mention.full_text).strip()))
-                if condition_to_skeep_this_mention:
-                    logging.info(f"Already replied to this mention: {mention_id}. Waiting ...")
-                    time.sleep(5)
-                    continue
-                since_id = max(since_id, mention_id)
-                mention_data = self.get_status_data(mention)
-                if not mention_data :
-                    logging.info("Mentions, but no tweet to translate. Waiting...")
-                    time.sleep(15)
-                    continue
-                traslated_tweet = self.translate(
-                                    src_language=mention_data["src_language"],
-                                    tgt_language=mention_data["tgt_language"],
-                                    text_to_translate=mention_data["translate_this_text"]
-                                    )
-                self.reply_to_the_tweet(
-                    text_to_reply=traslated_tweet,
-                    tweet_to_reply=mention_data["reply_to_this_tweet"])
-            logging.info("No mentions. Waiting...")
-            time.sleep(15)
+            # wait for a mention, then take the other pending ones
+            pending: Dict[int, Optional[int]] = dict([mentions.get()])
+            while len(pending) < TRANSLATION_BATCH_SIZE and not mentions.empty():
+                pending.update([mentions.get_nowait()])
+            for mention_id in [mention_id for mention_id in pending
+                                if mention_id in already_replied_mentions]:
+                logging.info(f"Already replied to this mention: {mention_id}.")
+                del pending[mention_id]
+            if not pending:
+                continue
+            # fetch the mentions and the tweets they reply to in a single request
+            ids = sorted(set(pending) | {replied_to_id for replied_to_id in pending.values()
+                                            if replied_to_id is not None})
+            try:
+                statuses: Dict[int, Status] = {status.id: status for status in
+                                                self.api.lookup_statuses(ids, tweet_mode="extended")}
+            except tweepy.TweepyException as error:
+                logging.info(f"Could not fetch the mentions {sorted(pending)}: {error}")
+                # the mentions are queued again, to be handled once twitter answers
+                for pending_mention in pending.items():
+                    mentions.put(pending_mention)
+                time.sleep(LOOKUP_RETRY_DELAY)
+                continue
+            # the deleted tweets, private accounts, etc. are not returned
+            batch: List[Tuple[Status, Optional[Status]]] = [
+                                        (statuses[mention_id], statuses.get(replied_to_id))
+                                        for mention_id, replied_to_id in pending.items()
+                                        if mention_id in statuses]
+            for (mention, _), is_replied in zip(batch, self.handle_mentions(batch)):
+                if is_replied:
+                    self.add_replied_mention(mention.id)
+            # the mentions missing from the lookup were deleted, made private, etc.
+            self.mentions_since_id = max(self.mentions_since_id, *pending)
 
 def main() -> None:
     """Instanciate a translator bot and runs it."""
@@ -291,7 +789,8 @@ def main() -> None:
                         access_token=os.environ["access_token"],
                         secret_access_token=os.environ["secret_access_token"],
                         translator=os.environ["translator"],
-                        ngram_models_folder="ngram_language_models"
+                        ngram_models_folder="ngram_language_models",
+                        bearer_token=os.environ["bearer_token"]
                     )
     translator_bot.run_bot()
 